@@ -1,9 +1,144 @@
 # this file is used to get the data from the database and return it in a way that can be used by the recommendation tool
+import json
+import logging
 import sqlite3
-import re
-from datetime import datetime, timedelta  # this is used for the layover routes to make sure that the 2nd flight departs after the first flight arrives
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+DB_PATH = "travel_data_with_miles.db"
+
+log = logging.getLogger(__name__)
+
+# every query this module runs. keeping the statement texts in one place means each is prepared once per
+# connection and then served from sqlite3's statement cache
+SQL_DIRECT = """
+    SELECT airline, flight_number, departure_time, arrival_time, price, miles
+    FROM flights
+    WHERE route_origin = ? AND route_destination = ? AND date = ?
+"""
+
+# first leg origin -> hub joined to second leg hub -> destination on the same day.
+# the layover check and the price/miles totals run in sqlite: the 2nd flight must depart after the 1st arrives plus the minimum layover.
+# the earliest allowed departure is an ISO string worked out once per first leg, and the index seeks past it.
+# the hub list is bound as one JSON array parameter (NULL for every hub), so the same statement serves any number of hubs.
+# the fees only depend on the hub, so the callers work them out once per hub
+SQL_SYNTHETIC = """
+    SELECT f1.airline, f1.flight_number, f1.departure_time, f1.arrival_time, f1.price, f1.miles,
+           f2.airline, f2.flight_number, f2.departure_time, f2.arrival_time, f2.price, f2.miles,
+           f1.route_destination, f1.price + f2.price, f1.miles + f2.miles
+    FROM flights f1
+    JOIN flights f2 ON f2.route_origin = f1.route_destination AND f2.date = +f1.date
+    WHERE f1.route_origin = ? AND f2.route_destination = ? AND f1.date = ?
+      AND f2.departure_time > strftime('%Y-%m-%dT%H:%M:%S', f1.arrival_time, ? || ' minutes')
+      AND (? IS NULL OR f1.route_destination IN (SELECT value FROM json_each(?)))
+"""
+
+# airports the origin flies to / that fly to the destination on a date; both are covered by
+# idx_flights_o_date / idx_flights_d_date, so DISTINCT reads straight off the index
+SQL_HUBS_FROM_ORIGIN = """
+    SELECT DISTINCT route_destination
+    FROM flights
+    WHERE route_origin = ? AND date = ?
+"""
+
+SQL_HUBS_TO_DESTINATION = """
+    SELECT DISTINCT route_origin
+    FROM flights
+    WHERE route_destination = ? AND date = ?
+"""
+
+# the optional filters prune rows before they reach python (pass NULL to skip one): a price cap, and a
+# value-per-mile floor checked as (price - fees) * 100 >= floor * miles
+SQL_DIRECT_RANGE = """
+    SELECT airline, flight_number, departure_time, arrival_time, price, miles, date
+    FROM flights
+    WHERE route_origin = ? AND route_destination = ? AND date BETWEEN ? AND ?
+      AND (? IS NULL OR price <= ?)
+      AND (? IS NULL OR (price - ?) * 100 >= ? * miles)
+"""
+
+# same join over a date range, with the same optional filters as SQL_DIRECT_RANGE applied to the pair totals.
+# the unary + keeps sqlite from copying the BETWEEN range onto f2.date, so the second leg lookup
+# stays an equality on date and can seek on departure_time. the layover is returned in whole minutes
+SQL_SYNTHETIC_RANGE = """
+    SELECT f1.airline, f1.flight_number, f1.departure_time, f1.arrival_time, f1.price, f1.miles,
+           f2.airline, f2.flight_number, f2.departure_time, f2.arrival_time, f2.price, f2.miles,
+           f1.route_destination, f1.date, f1.price + f2.price, f1.miles + f2.miles,
+           CAST(round((julianday(f2.departure_time) - julianday(f1.arrival_time)) * 1440) AS INTEGER)
+    FROM flights f1
+    JOIN flights f2 ON f2.route_origin = f1.route_destination AND f2.date = +f1.date
+    WHERE f1.route_origin = ? AND f2.route_destination = ? AND f1.date BETWEEN ? AND ?
+      AND f2.departure_time > strftime('%Y-%m-%dT%H:%M:%S', f1.arrival_time, ? || ' minutes')
+      AND (? IS NULL OR f1.price + f2.price <= ?)
+      AND (? IS NULL OR (f1.price + f2.price - ?) * 100 >= ? * (f1.miles + f2.miles))
+"""
+
+# indexes for the route/date lookups; the last two cover the DISTINCT hub queries.
+# departure_time on the first one lets the layover check seek straight to valid second legs
+SQL_CREATE_INDEXES = """
+    CREATE INDEX IF NOT EXISTS idx_flights_od_date_dep ON flights(route_origin, route_destination, date, departure_time);
+    CREATE INDEX IF NOT EXISTS idx_flights_o_date ON flights(route_origin, date, route_destination);
+    CREATE INDEX IF NOT EXISTS idx_flights_d_date ON flights(route_destination, date, route_origin);
+"""
+_INDEX_NAMES = frozenset(("idx_flights_od_date_dep", "idx_flights_o_date", "idx_flights_d_date"))
+
+SQL_INDEX_NAMES = "SELECT name FROM sqlite_master WHERE type = 'index'"
+
+
+# one cached connection per database file, mode and slot (process-wide; recommend_routes' worker uses slot 1)
+def _conn(db_path, read_only=True, slot=0):
+    return _open_conn(db_path, bool(read_only), slot)
+
+
+@lru_cache(maxsize=8)
+def _open_conn(db_path, read_only, slot):
+    return _connect(db_path, read_only)
+
+
+# read-only connections are immutable snapshots (mode=ro&immutable=1), so sqlite skips locking and journal reads.
+# the .db must not change while they are open: replacing it needs a restart of the process
+def _connect(db_path, read_only):
+    if read_only:
+        uri = Path(db_path).resolve().as_uri() + "?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=256)
+    else:
+        conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=256)
+    # read-side tuning only: these connections never write, so journal/synchronous settings are left alone
+    conn.executescript("""
+        PRAGMA temp_store = MEMORY;
+        PRAGMA cache_size = -20000;
+        PRAGMA mmap_size = 268435456;
+    """)
+    return conn
+
+
+# one-off: builds the lookup indexes in a database file that lacks them (the shipped .db has them).
+# returns False, after logging why, if it can't write
+def ensure_indexes(db_path=DB_PATH):
+    try:
+        conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=rw", uri=True)
+    except sqlite3.OperationalError as exc:
+        log.warning("can't open %s to build indexes: %s", db_path, exc)
+        return False
+    try:
+        conn.executescript(SQL_CREATE_INDEXES)
+    except sqlite3.OperationalError as exc:
+        log.warning("can't build indexes in %s: %s", db_path, exc)
+        return False
+    finally:
+        conn.close()
+    return True
 
 
+# read-only check that the lookup indexes are there; logs the missing ones and returns False if not
+def check_indexes(db_path=DB_PATH):
+    missing = _INDEX_NAMES - {row[0] for row in _conn(db_path).execute(SQL_INDEX_NAMES)}
+    if missing:
+        log.warning("%s has no %s; build them with ensure_indexes()", db_path, ", ".join(sorted(missing)))
+    return not missing
+
 
 # utilizing Kathan's value-per-mile function
 def calculate_value_per_mile(cash_price, taxes_and_fees, miles_used):
@@ -15,97 +150,56 @@ def calculate_value_per_mile(cash_price, taxes_and_fees, miles_used):
 
 # gets all of the direct flights from the database for a given origin, destination, and date
 def get_direct_flights(origin, destination, date):
-    conn = sqlite3.connect("travel_data_with_miles.db")
-    cursor = conn.cursor()
+    cursor = _conn(DB_PATH).cursor()
 
-    cursor.execute("""
-        SELECT airline, flight_number, departure_time, arrival_time, price, miles
-        FROM flights
-        WHERE route_origin = ? AND route_destination = ? AND date = ?
-    """, (origin, destination, date))
+    cursor.execute(SQL_DIRECT, (origin, destination, date))
 
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    return cursor.fetchall()
 
 
 # finds all hub airports that have flights from origin and to destination on the given date
 def get_possible_hub_airports(origin, destination, date):
-    conn = sqlite3.connect("travel_data_with_miles.db")
-    cursor = conn.cursor()
+    conn = _conn(DB_PATH)
 
     # get all airports the origin flies to on this date
-    cursor.execute("""
-        SELECT DISTINCT route_destination
-        FROM flights
-        WHERE route_origin = ? AND date = ?
-    """, (origin, date))
-    from_origin = set(row[0] for row in cursor.fetchall())
+    from_origin = set(row[0] for row in conn.execute(SQL_HUBS_FROM_ORIGIN, (origin, date)))
 
     # get all airports that fly to the destination on this date
-    cursor.execute("""
-        SELECT DISTINCT route_origin
-        FROM flights
-        WHERE route_destination = ? AND date = ?
-    """, (destination, date))
-    to_dest = set(row[0] for row in cursor.fetchall())
-
-    conn.close()
+    to_dest = set(row[0] for row in conn.execute(SQL_HUBS_TO_DESTINATION, (destination, date)))
 
     # intersection gives us valid hubs
     return list(from_origin & to_dest)
 
 
+# higher fees for international routes, lower for domestic
+_INTERNATIONAL_ROUTES = frozenset([("JFK", "LHR"), ("DXB", "LHR"), ("LAX", "HND")])
+_INTERNATIONAL_FEES = 50.00
+_DOMESTIC_FEES = 11.20
+
+
 # since there are no specific taxes/fees in the database, we will estimate them based on the origin and destination
 def estimate_taxes_and_fees(origin, destination):
-    # higher fees for international routes, lower for domestic
-    international_routes = [("JFK", "LHR"), ("DXB", "LHR"), ("LAX", "HND")]
-    if (origin, destination) in international_routes:
-        return 50.00
+    if (origin, destination) in _INTERNATIONAL_ROUTES:
+        return _INTERNATIONAL_FEES
     else:
-        return 11.20
+        return _DOMESTIC_FEES
 
 
 # gets all of the routes with layovers for a given origin, destination, date, and hub airports
+# (pass hub_airports=None to let the join discover every hub). routes are yielded one at a time, straight off the cursor
 def get_synthetic_routes(origin, destination, date, hub_airports, min_layover_minutes=45):
-    conn = sqlite3.connect("travel_data_with_miles.db")
-    cursor = conn.cursor()
-    synthetic_routes = []
-
-    for hub in hub_airports:
-        # first leg: origin to midway hub
-        cursor.execute("""
-            SELECT airline, flight_number, departure_time, arrival_time, price, miles
-            FROM flights
-            WHERE route_origin = ? AND route_destination = ? AND date = ?
-        """, (origin, hub, date))
-        first_legs = cursor.fetchall()
-
-        # second leg: midway hub to destination
-        cursor.execute("""
-            SELECT airline, flight_number, departure_time, arrival_time, price, miles
-            FROM flights
-            WHERE route_origin = ? AND route_destination = ? AND date = ?
-        """, (hub, destination, date))
-        second_legs = cursor.fetchall()
-
-        for flight1 in first_legs:
-            for flight2 in second_legs:
-                # make sure the layover timing is valid (ex. if flight1 arrives at 12:00, flight2 must depart after that)
-                arr1 = datetime.fromisoformat(flight1[3])
-                dep2 = datetime.fromisoformat(flight2[2])
-
-                # ✅ enforce minimum layover window
-                if dep2 <= arr1 + timedelta(minutes=min_layover_minutes):
-                    continue
-
-                total_price = flight1[4] + flight2[4]
-                total_miles = flight1[5] + flight2[5]
-                taxes = estimate_taxes_and_fees(origin, hub) + estimate_taxes_and_fees(hub, destination)
-                synthetic_routes.append((hub, flight1, flight2, total_price, total_miles, taxes))
-
-    conn.close()
-    return synthetic_routes
+    cursor = _conn(DB_PATH).cursor()
+    hubs_json = None if hub_airports is None else json.dumps(list(hub_airports))
+    hub_taxes = {}
+
+    cursor.execute(SQL_SYNTHETIC, (origin, destination, date, min_layover_minutes, hubs_json, hubs_json))
+
+    for row in cursor:
+        hub = row[12]
+        flight1, flight2, total_price, total_miles = row[:6], row[6:12], row[13], row[14]
+        if hub not in hub_taxes:
+            hub_taxes[hub] = estimate_taxes_and_fees(origin, hub) + estimate_taxes_and_fees(hub, destination)
+        yield (hub, flight1, flight2, total_price, total_miles, hub_taxes[hub])
 
 
 # main function to recommend the best route based on value per mile
@@ -115,49 +209,77 @@ def recommend_best_route(origin, destination, date, hub_airports, min_layover_mi
         origin, destination, date, hub_airports, min_layover_minutes=min_layover_minutes
     )
 
-    all_options = []
+    # keep only the best option seen so far; the winning dictionary is built once at the end.
+    # strict > keeps the first option on ties, the same as max() would
+    best = None
+    best_vpm = float("-inf")
 
-    # addressing direct flights
+    # addressing direct flights (they all share the same estimated fees)
+    taxes = estimate_taxes_and_fees(origin, destination)
     for flight in direct_options:
         airline, flight_number, dep, arr, price, miles = flight
-        taxes = estimate_taxes_and_fees(origin, destination)
         value = calculate_value_per_mile(price, taxes, miles)
-
-        all_options.append({  # creating a dictionary for each flight option
-            "type": "Direct",
-            "route": [(origin, destination)],
-            "flights": [flight],
-            "price": price,
-            "miles": miles,
-            "taxes": taxes,
-            "value_per_mile": value
-        })
+        if value > best_vpm:
+            best_vpm = value
+            best = ("Direct", [(origin, destination)], [flight], price, miles, taxes)
 
     # addressing flights with layovers
-    for hub, flight1, flight2, total_price, total_miles, taxes in synthetic_options:
-        value = calculate_value_per_mile(total_price, taxes, total_miles)
-
-        all_options.append({
-            "type": "Synthetic",
-            "route": [(origin, hub), (hub, destination)],
-            "flights": [flight1, flight2],
-            "price": total_price,
-            "miles": total_miles,
-            "taxes": taxes,
-            "value_per_mile": value
-        })
+    for hub, flight1, flight2, total_price, total_miles, hub_taxes in synthetic_options:
+        value = calculate_value_per_mile(total_price, hub_taxes, total_miles)
+        if value > best_vpm:
+            best_vpm = value
+            best = ("Synthetic", [(origin, hub), (hub, destination)], [flight1, flight2], total_price, total_miles, hub_taxes)
 
     # if no flight options are available, return a message
-    if not all_options:
+    if best is None:
         return "No flights available for that day."
 
-    # determining the best option based on value per mile. looks through each dictionary in the list called all_options, finding which has the highest value of the key value_per_mile
-    best_option = max(all_options, key=lambda x: x["value_per_mile"])
-    return best_option
+    route_type, route, flights, price, miles, taxes = best
+    return {
+        "type": route_type,
+        "route": route,
+        "flights": flights,
+        "price": price,
+        "miles": miles,
+        "taxes": taxes,
+        "value_per_mile": best_vpm
+    }
 
 # now allows users to get recommendations for a range of dates, with more options and filters
+import numpy as np
 import pandas as pd
 
+
+# flat per-leg columns in raw leg tuple order, None on a direct's second leg. dtypes are pinned so they don't depend on the rows
+_LEG_FIELDS = ("airline", "flight_number", "departure_time", "arrival_time", "price", "miles")
+_LEG_FIELD_DTYPES = {
+    "airline": "object", "flight_number": "object", "departure_time": "object", "arrival_time": "object",
+    "price": "float64", "miles": "Int32",
+}
+_LEG_DTYPES = {f"leg{n}_{field}": _LEG_FIELD_DTYPES[field] for n in (1, 2) for field in _LEG_FIELDS}
+_NO_LEG = (None,) * len(_LEG_FIELDS)
+
+
+# turns the raw leg tuples of the returned rows into the leg1_* / leg2_* columns
+def _leg_columns(flights_raw):
+    leg1 = [legs[0] for legs in flights_raw]
+    leg2 = [legs[1] if len(legs) > 1 else _NO_LEG for legs in flights_raw]
+    out = {}
+    for n, legs in ((1, leg1), (2, leg2)):
+        for i, field in enumerate(_LEG_FIELDS):
+            out[f"leg{n}_{field}"] = [leg[i] for leg in legs]
+    return out
+
+
+# same math as calculate_value_per_mile, but over whole columns of candidates at once
+def calculate_value_per_mile_batch(cash_prices, taxes_and_fees, miles_used):
+    cash_prices = np.asarray(cash_prices, dtype=np.float64)
+    taxes_and_fees = np.asarray(taxes_and_fees, dtype=np.float64)
+    miles_used = np.asarray(miles_used, dtype=np.float64)
+    if (miles_used == 0).any():
+        raise ValueError("Miles used cannot be zero.")
+    return np.round((cash_prices - taxes_and_fees) / miles_used * 100, 2)
+
 def recommend_routes(
     origin: str,
     destination: str,
@@ -170,167 +292,149 @@ def recommend_routes(
     max_price = None,            # e.g., 350.0 ($)
     airline_allowlist = None,  # e.g., ["AA","DL","B6"]
     max_results: int = 100,
-    db_path: str = "travel_data_with_miles.db",
+    db_path: str = DB_PATH,
+    read_only: bool = True,      # open the database as a read-only, immutable snapshot
 ) -> pd.DataFrame:
     """
     Return a DataFrame of candidate routes across a date range for UI consumption.
-    Columns (at minimum): date, type, origin, destination, airline, price, miles, taxes, value_per_mile_cents, route, flights_json
+    Columns (at minimum): date, type, origin, destination, airline, price, miles, taxes, value_per_mile_cents, route,
+    leg1_airline, leg1_flight_number, leg1_departure_time, leg1_arrival_time, leg1_price, leg1_miles,
+    leg2_* (same six; None on directs), layover_minutes (None on directs)
+    Rows are ranked by the objective; rows that tie on it are ordered by date, then directs before synthetics, then
+    hub, departure times and flights, so the max_results cutoff always keeps the same rows.
     """
-    # local helpers reuse your functions but allow db_path override
-    def _get_direct_flights(origin, destination, date):
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT airline, flight_number, departure_time, arrival_time, price, miles
-            FROM flights
-            WHERE route_origin = ? AND route_destination = ? AND date = ?
-        """, (origin, destination, date))
-        results = cursor.fetchall()
-        conn.close()
-        return results
-
-    def _get_possible_hub_airports(origin, destination, date):
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT DISTINCT route_destination
-            FROM flights
-            WHERE route_origin = ? AND date = ?
-        """, (origin, date))
-        from_origin = set(row[0] for row in cursor.fetchall())
-        cursor.execute("""
-            SELECT DISTINCT route_origin
-            FROM flights
-            WHERE route_destination = ? AND date = ?
-        """, (destination, date))
-        to_dest = set(row[0] for row in cursor.fetchall())
-        conn.close()
-        return list(from_origin & to_dest)
-
-    def build_synthetic_routes(origin, destination, date, hub_airports):
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        synthetic_routes = []
-        for hub in hub_airports:
-            cursor.execute("""
-                SELECT airline, flight_number, departure_time, arrival_time, price, miles
-                FROM flights
-                WHERE route_origin = ? AND route_destination = ? AND date = ?
-            """, (origin, hub, date))
-            first_legs = cursor.fetchall()
-            cursor.execute("""
-                SELECT airline, flight_number, departure_time, arrival_time, price, miles
-                FROM flights
-                WHERE route_origin = ? AND route_destination = ? AND date = ?
-            """, (hub, destination, date))
-            second_legs = cursor.fetchall()
-
-            for flight1 in first_legs:
-                for flight2 in second_legs:
-                    arr1 = datetime.fromisoformat(flight1[3])
-                    dep2 = datetime.fromisoformat(flight2[2])
-
-                    # layover rule
-                    if dep2 <= arr1 + timedelta(minutes=min_layover_minutes):
-                        continue
-
-                    total_price = float(flight1[4]) + float(flight2[4])
-                    total_miles = int(flight1[5]) + int(flight2[5])
-                    taxes = estimate_taxes_and_fees(origin, hub) + estimate_taxes_and_fees(hub, destination)
-
-                    synthetic_routes.append((hub, flight1, flight2, total_price, total_miles, taxes))
-        conn.close()
-        return synthetic_routes
-
-    # iterate dates
+    # normalize the date range
     start = datetime.fromisoformat(start_date).date()
     end = datetime.fromisoformat(end_date).date()
     if end < start:
         start, end = end, start
-
-    rows = []
-    day = start
-    while day <= end:
-        date_str = day.isoformat()
-
-        # DIRECTS
-        for f in _get_direct_flights(origin, destination, date_str):
-            airline, flight_number, dep, arr, price, miles = f
-            taxes = estimate_taxes_and_fees(origin, destination)
-            vpm_cents = calculate_value_per_mile(float(price), float(taxes), int(miles))
-
-            rows.append({
-                "date": date_str,
-                "type": "Direct",
-                "origin": origin,
-                "destination": destination,
-                "airline": airline,
-                "price": float(price),
-                "miles": int(miles),
-                "taxes": float(taxes),
-                "value_per_mile_cents": float(vpm_cents),
-                "route": [(origin, destination)],
-                "flights_json": [
-                    {"airline": airline, "flight_number": flight_number,
-                     "departure_time": dep, "arrival_time": arr,
-                     "price": float(price), "miles": int(miles)}
-                ],
-            })
-
-        # SYNTHETIC
-        if include_synthetic:
-            hubs = _get_possible_hub_airports(origin, destination, date_str)
-            for hub, f1, f2, total_price, total_miles, taxes in build_synthetic_routes(origin, destination, date_str, hubs):
-                vpm_cents = calculate_value_per_mile(float(total_price), float(taxes), int(total_miles))
-                rows.append({
-                    "date": date_str,
-                    "type": "Synthetic",
-                    "origin": origin,
-                    "destination": destination,
-                    "airline": f"{f1[0]}+{f2[0]}",
-                    "price": float(total_price),
-                    "miles": int(total_miles),
-                    "taxes": float(taxes),
-                    "value_per_mile_cents": float(vpm_cents),
-                    "route": [(origin, hub), (hub, destination)],
-                    "flights_json": [
-                        {"airline": f1[0], "flight_number": f1[1], "departure_time": f1[2], "arrival_time": f1[3], "price": float(f1[4]), "miles": int(f1[5])},
-                        {"airline": f2[0], "flight_number": f2[1], "departure_time": f2[2], "arrival_time": f2[3], "price": float(f2[4]), "miles": int(f2[5])},
-                    ],
-                })
-        day += timedelta(days=1)
+    start_str, end_str = start.isoformat(), end.isoformat()
 
     # Always use a fixed schema so empty results don't break the UI
+    leg_cols = [f"leg{n}_{field}" for n in (1, 2) for field in _LEG_FIELDS]
     cols = [
         "date", "type", "origin", "destination", "airline", "price",
-        "miles", "taxes", "value_per_mile_cents", "route", "flights_json"
+        "miles", "taxes", "value_per_mile_cents", "route", *leg_cols, "layover_minutes"
     ]
-    df = pd.DataFrame(rows, columns=cols)
+    # exact, case-insensitive airline names (ignoring empties); a synthetic route matches if any leg does
+    allow = {str(s).strip().upper() for s in (airline_allowlist or ()) if s and str(s).strip()}
+
+    # results are collected column by column; _airline_codes, flights_raw and _route_key are helpers dropped at the end
+    cols_data = {c: [] for c in cols if c not in leg_cols}
+    if allow:
+        cols_data["_airline_codes"] = []
+    cols_data["flights_raw"] = []
+    cols_data["_route_key"] = []
+
+    # every direct flight shares the same estimated fees
+    direct_taxes = estimate_taxes_and_fees(origin, destination)
+
+    # max_price and min_vpm_cents also prune inside sqlite; the vpm floor there is a cent loose, the exact check runs below
+    price_cap = None if max_price is None else float(max_price)
+    vpm_floor = None if min_vpm_cents is None else float(min_vpm_cents) - 0.01
+    min_synthetic_taxes = 2 * min(_DOMESTIC_FEES, _INTERNATIONAL_FEES)
+
+    # one self-join covers the whole date range. it runs on its own connection in a worker thread and fetches all
+    # its rows while this thread reads the directs (sqlite3 releases the GIL while a statement runs)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="flights-db") as pool:
+        synthetic_future = None
+        if include_synthetic:
+            synthetic_conn = _conn(db_path, read_only, slot=1)
+            synthetic_params = (
+                origin, destination, start_str, end_str, min_layover_minutes,
+                price_cap, price_cap, vpm_floor, min_synthetic_taxes, vpm_floor,
+            )
+            synthetic_future = pool.submit(
+                lambda: synthetic_conn.execute(SQL_SYNTHETIC_RANGE, synthetic_params).fetchall()
+            )
+
+        # DIRECTS
+        direct_rows = _conn(db_path, read_only).execute(SQL_DIRECT_RANGE, (
+            origin, destination, start_str, end_str,
+            price_cap, price_cap, vpm_floor, direct_taxes, vpm_floor,
+        ))
+        for row in direct_rows:
+            airline, flight_number, dep, arr, price, miles, date_str = row
+            taxes = direct_taxes
+
+            cols_data["date"].append(date_str)
+            cols_data["type"].append("Direct")
+            cols_data["origin"].append(origin)
+            cols_data["destination"].append(destination)
+            cols_data["airline"].append(airline)
+            if allow:
+                cols_data["_airline_codes"].append(frozenset(((airline or "").upper(),)))
+            cols_data["price"].append(float(price))
+            cols_data["miles"].append(int(miles))
+            cols_data["taxes"].append(float(taxes))
+            cols_data["route"].append([(origin, destination)])
+            cols_data["flights_raw"].append((row[:6],))
+            cols_data["_route_key"].append(f"{dep} {airline} {flight_number}")
+            cols_data["layover_minutes"].append(None)
+
+    # SYNTHETIC
+    if synthetic_future is not None:
+        hub_taxes = {}
+        for row in synthetic_future.result():
+            f1, f2, hub, date_str, total_price, total_miles, layover = row[:6], row[6:12], *row[12:]
+            if hub not in hub_taxes:
+                hub_taxes[hub] = estimate_taxes_and_fees(origin, hub) + estimate_taxes_and_fees(hub, destination)
+            taxes = hub_taxes[hub]
+            cols_data["date"].append(date_str)
+            cols_data["type"].append("Synthetic")
+            cols_data["origin"].append(origin)
+            cols_data["destination"].append(destination)
+            cols_data["airline"].append(f"{f1[0]}+{f2[0]}")
+            if allow:
+                cols_data["_airline_codes"].append(frozenset(((f1[0] or "").upper(), (f2[0] or "").upper())))
+            cols_data["price"].append(float(total_price))
+            cols_data["miles"].append(int(total_miles))
+            cols_data["taxes"].append(float(taxes))
+            cols_data["route"].append([(origin, hub), (hub, destination)])
+            cols_data["flights_raw"].append((f1, f2))
+            cols_data["_route_key"].append(f"{hub} {f1[2]} {f2[2]} {f1[0]} {f1[1]} {f2[0]} {f2[1]}")
+            cols_data["layover_minutes"].append(layover)
+
+    # value per mile is scored for every candidate in one vectorized pass
+    cols_data["value_per_mile_cents"] = calculate_value_per_mile_batch(
+        cols_data["price"], cols_data["taxes"], cols_data["miles"]
+    )
+    df = pd.DataFrame(cols_data)
+    # compact dtypes: categoricals for airline/type, 32-bit integers. money stays float64 (float32 turns 123.45 into 123.4499969)
+    df = df.astype({"type": "category", "airline": "category", "miles": "int32", "layover_minutes": "Int32"})
 
 
     # filters
     if not df.empty:
         if min_vpm_cents is not None:
             df = df[df["value_per_mile_cents"] >= float(min_vpm_cents)]
-        if max_price is not None:
-            df = df[df["price"] <= float(max_price)]
-        if airline_allowlist:
-            # escape special regex characters, ignore empties, case-insensitive match
-            pats = [re.escape(str(s).strip()) for s in airline_allowlist if s and str(s).strip()]
-            if pats:
-                pattern = "|".join(pats)
-                df = df[df["airline"].str.contains(pattern, case=False, regex=True, na=False)]
-
-        # objective sort
+        if allow:
+            df = df[~df["_airline_codes"].map(allow.isdisjoint).astype(bool)]
+
+        # objective sort. with max_results set, nsmallest/nlargest (heap based) first cut the frame down to the
+        # top rows, keeping ties at the cutoff, so only those get the full multi-key sort. the sort ends on
+        # date, type (Direct first) and _route_key, so rows that tie on the objective don't keep whatever order
+        # the queries returned them in
+        tiebreak = ["date", "type", "_route_key"]
         if objective == "min_fees" and "taxes" in df.columns:
-            df = df.sort_values(["taxes", "price", "value_per_mile_cents"], ascending=[True, True, False])
+            if max_results:
+                df = df.nsmallest(int(max_results), ["taxes", "price"], keep="all")
+            df = df.sort_values(
+                ["taxes", "price", "value_per_mile_cents", *tiebreak], ascending=[True, True, False, True, True, True],
+                kind="stable",
+            )
         else:
-            df = df.sort_values(["value_per_mile_cents", "price"], ascending=[False, True])
+            if max_results:
+                df = df.nlargest(int(max_results), "value_per_mile_cents", keep="all")
+            df = df.sort_values(
+                ["value_per_mile_cents", "price", *tiebreak], ascending=[False, True, True, True, True], kind="stable",
+            )
 
         if max_results:
             df = df.head(int(max_results))
 
-    return df.reset_index(drop=True)
+    df = df.assign(**_leg_columns(df["flights_raw"].tolist())).astype(_LEG_DTYPES)
+    return df[cols].reset_index(drop=True)
 
 # this function runs the recommendation tool, allowing users to input their origin, destination, and date
 if __name__ == "__main__":  # using this to make sure that the code only runs when this file is run directly, not when it is imported
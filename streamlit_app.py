@@ -1,59 +1,108 @@
 import streamlit as st
 import pandas as pd
 import os
+import re
 import numpy as np
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta
 import pydeck as pdk
 import recommendation_tool as recommendation
 
-# ---- flatten flights_json into readable columns ----
-def _fmt(ts):
-    try:
-        return datetime.fromisoformat(str(ts)).strftime("%Y-%m-%d %H:%M")
-    except Exception:
-        return str(ts) if ts else ""
+# airport codes inside the route text, e.g. "LAX", "JFK"
+_IATA_RE = re.compile(r"\b[A-Z]{3}\b")
+
+# ---- format the backend's flat leg columns for display ----
+_LEG_RAW_COLS = [
+    f"leg{n}_{field}" for n in (1, 2)
+    for field in ("airline", "flight_number", "departure_time", "arrival_time", "price", "miles")
+]
+
+def _fmt_times(col: pd.Series) -> pd.Series:
+    return pd.to_datetime(col, errors="coerce", format="ISO8601").dt.strftime("%Y-%m-%d %H:%M").fillna("")
 
 def _leg_columns(df_in: pd.DataFrame) -> pd.DataFrame:
-    df_out = df_in.copy()
-    # add empty columns (safe even if we re-run)
-    for col in [
-        "Leg 1 Flight", "Leg 1 Departs", "Leg 1 Arrives",
-        "Leg 2 Flight", "Leg 2 Departs", "Leg 2 Arrives",
-        "Layover (min)"
-    ]:
-        if col not in df_out.columns:
-            df_out[col] = ""
-
-    # iterate rows to extract legs
-    for i, row in df_out.iterrows():
-        legs = row.get("flights_json", [])
-        if isinstance(legs, list) and len(legs) >= 1:
-            l1 = legs[0]
-            l1_label = f"{l1.get('airline','')} {l1.get('flight_number','')}".strip()
-            df_out.at[i, "Leg 1 Flight"]  = l1_label
-            df_out.at[i, "Leg 1 Departs"] = _fmt(l1.get("departure_time"))
-            df_out.at[i, "Leg 1 Arrives"] = _fmt(l1.get("arrival_time"))
-
-        if isinstance(legs, list) and len(legs) >= 2:
-            l2 = legs[1]
-            l2_label = f"{l2.get('airline','')} {l2.get('flight_number','')}".strip()
-            df_out.at[i, "Leg 2 Flight"]  = l2_label
-            df_out.at[i, "Leg 2 Departs"] = _fmt(l2.get("departure_time"))
-            df_out.at[i, "Leg 2 Arrives"] = _fmt(l2.get("arrival_time"))
-
-            # compute layover
-            try:
-                arr1 = datetime.fromisoformat(legs[0]["arrival_time"])
-                dep2 = datetime.fromisoformat(legs[1]["departure_time"])
-                lay = int((dep2 - arr1).total_seconds() / 60)
-                df_out.at[i, "Layover (min)"] = str(lay)  # Convert to string to avoid type issues
-            except Exception:
-                df_out.at[i, "Layover (min)"] = ""
-
-    # remove raw object column from UI/CSV
-    if "flights_json" in df_out.columns:
-        df_out = df_out.drop(columns=["flights_json"])
-    return df_out
+    new_cols = {}
+    for n in (1, 2):
+        label = f"Leg {n}"
+        departs = df_in.get(f"leg{n}_departure_time")
+        # directs-only results (e.g. Aug 31) skip the leg 2 formatting entirely. keyed on the departure time, which
+        # every real leg has; airline is nullable in the flights table
+        if departs is None or departs.isna().all():
+            for col in ("Flight", "Departs", "Arrives"):
+                new_cols[f"{label} {col}"] = ""
+            continue
+        new_cols[f"{label} Flight"] = (df_in[f"leg{n}_airline"].fillna("").astype(str) + " " + df_in[f"leg{n}_flight_number"].fillna("").astype(str)).str.strip()
+        new_cols[f"{label} Departs"] = _fmt_times(departs)
+        new_cols[f"{label} Arrives"] = _fmt_times(df_in[f"leg{n}_arrival_time"])
+
+    # layover comes from the backend in whole minutes; kept as text so direct rows can stay blank
+    lay = df_in["layover_minutes"] if "layover_minutes" in df_in.columns else pd.Series(pd.NA, index=df_in.index, dtype="Int64")
+    new_cols["Layover (min)"] = lay.astype(str).where(lay.notna(), "")
+
+    # the raw leg columns are replaced by the display ones in the UI/CSV
+    return df_in.drop(columns=_LEG_RAW_COLS + ["layover_minutes"], errors="ignore").assign(**new_cols)
+
+# static assets: parsed once per process, re-read only when the file changes
+@st.cache_data(show_spinner=False)
+def _load_css(path, mtime):
+    with open(path) as f:
+        return f.read()
+
+@st.cache_data(show_spinner=False)
+def _load_airports(path, mtime):
+    df = pd.read_csv(path)
+    df["iata"] = df["iata"].astype(str).str.upper()
+    # indexed by code so pin lookup is a hash intersection, not a scan
+    return df.set_index("iata")
+
+# keyed on view_key (see the main block); the leading underscore makes streamlit skip hashing the frame itself
+@st.cache_data(max_entries=16, show_spinner=False)
+def _df_to_csv_bytes(view_key, _df):
+    return _df.to_csv(index=False).encode("utf-8")
+
+# summary card numbers, keyed on view_key like the CSV
+@st.cache_data(max_entries=16, show_spinner=False)
+def _summary(view_key, _df):
+    best_vpm = float(_df["Value per Mile (¢)"].max()) if "Value per Mile (¢)" in _df.columns and len(_df) else None
+    return len(_df), best_vpm
+
+# the deck only depends on the pins, so identical result sets reuse the same object across reruns
+@st.cache_resource(show_spinner=False)
+def _build_deck(pins_records):
+    pins = pd.DataFrame(list(pins_records), columns=["iata", "lat", "lon"])
+    # pydeck wants columns named lon/lat
+    pins = pins.rename(columns={"lon": "longitude", "lat": "latitude"})
+    midpoint = {
+        "latitude": float(pins["latitude"].mean()),
+        "longitude": float(pins["longitude"].mean()),
+    }
+
+    # set a reasonable zoom (wider if points spread out)
+    if len(pins) == 1:
+        zoom = 8
+    else:
+        zoom = 3
+
+    layer = pdk.Layer(
+        "ScatterplotLayer",
+        data=pins,
+        get_position="[longitude, latitude]",
+        get_color=[255, 69, 0, 255],  # Bright orange-red color
+        get_radius=100000,  # Larger radius for better visibility
+        pickable=True,
+    )
+
+    tooltip = {"text": "{iata}"}
+
+    view_state = pdk.ViewState(
+        latitude=midpoint["latitude"], longitude=midpoint["longitude"], zoom=zoom
+    )
+
+    return pdk.Deck(layers=[layer], initial_view_state=view_state, tooltip=tooltip)
+
+# the shipped .db comes with its lookup indexes; checked once per process, read-only
+@st.cache_resource(show_spinner=False)
+def _check_db_indexes(db_path):
+    return recommendation.check_indexes(db_path)
 
 # Page config
 st.set_page_config(
@@ -63,8 +112,7 @@ st.set_page_config(
 )
 
 # Load and inject CSS
-with open('style.css') as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+st.markdown(f'<style>{_load_css("style.css", os.path.getmtime("style.css"))}</style>', unsafe_allow_html=True)
 
 # Hero section
 st.markdown("""
@@ -211,6 +259,8 @@ if (origin == "DXB" and destination == "LHR") or (origin == "LHR" and destinatio
 # Database file check
 if not os.path.exists("travel_data_with_miles.db"):
     errors.append("Database file 'travel_data_with_miles.db' not found")
+else:
+    _check_db_indexes("travel_data_with_miles.db")
 
 # Special date warnings
 if start_date <= date(2025, 8, 31) <= end_date and include_synthetic:
@@ -229,27 +279,52 @@ for warning in warnings:
 for info in infos:
     st.info(info)
 
-# Helper function to run search and cache results
-def _run_search_and_cache():
-    # call backend exactly as we already do (objective="vpm" per our previous change)
-    results = recommendation.recommend_routes(
+# Backend call memoized on the search parameters
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def _cached_recommend(origin, destination, start_date, end_date, include_synthetic, min_layover_minutes,
+                      min_vpm_cents_arg, max_price_arg, airline_allowlist_tuple, max_results):
+    return recommendation.recommend_routes(
         origin=origin,
         destination=destination,
-        start_date=str(start_date),
-        end_date=str(end_date),
+        start_date=start_date,
+        end_date=end_date,
         include_synthetic=include_synthetic,
-        min_layover_minutes=int(min_layover_minutes),
+        min_layover_minutes=min_layover_minutes,
         objective="vpm",  # always vpm; UI decides final sort
         min_vpm_cents=min_vpm_cents_arg,
         max_price=max_price_arg,
-        airline_allowlist=airline_allowlist_list,
-        max_results=int(max_results),
+        airline_allowlist=list(airline_allowlist_tuple) or None,
+        max_results=max_results,
         db_path="travel_data_with_miles.db",
     )
+
+# Helper function to run search and cache results
+def _run_search_and_cache():
+    search_params = (
+        origin,
+        destination,
+        str(start_date),
+        str(end_date),
+        include_synthetic,
+        int(min_layover_minutes),
+        min_vpm_cents_arg,
+        max_price_arg,
+        tuple(airline_allowlist_list or ()),
+        int(max_results),
+    )
+    results = _cached_recommend(*search_params)
     df_local = pd.DataFrame(results) if not isinstance(results, pd.DataFrame) else results.copy()
-    # store in session for later toggles / chart interactions
-    st.session_state["results_df"] = df_local
-    return df_local
+    # small fixed vocabularies -> category (int codes for sorting / isin / unique)
+    for c in ("origin", "destination", "airline", "type"):
+        if c in df_local.columns:
+            df_local[c] = df_local[c].astype("category")
+    # coerce miles once per search rather than on every rerun
+    if "miles" in df_local.columns:
+        df_local["miles"] = pd.to_numeric(df_local["miles"], errors="coerce")
+    # store in session for later toggles / chart interactions, with the key their derived views are cached on
+    results = (repr(search_params), df_local)
+    st.session_state["results"] = results
+    return results
 
 # Main content
 if not errors:
@@ -265,11 +340,12 @@ if not errors:
     search_clicked = st.button("🔍 Search Routes", type="primary")
     
     if search_clicked:
-        df = _run_search_and_cache()
-    elif "results_df" in st.session_state:
-        df = st.session_state["results_df"].copy()
+        results_key, df = _run_search_and_cache()
+    elif "results" in st.session_state:
+        results_key, df = st.session_state["results"]
+        df = df.copy()
     else:
-        df = pd.DataFrame()
+        results_key, df = None, pd.DataFrame()
     
     if df.empty:
         st.markdown("""
@@ -282,21 +358,23 @@ if not errors:
         # Process results
         # Rename and add computed columns
         df = df.rename(columns={"value_per_mile_cents": "Value per Mile (¢)"})
-        df["Estimated $ Saved"] = np.maximum(df["price"] - df["taxes"], 0).round(2)
+        # price - taxes, floored at 0, rounded -- all written into one float64 buffer
+        saved = np.subtract(df["price"].to_numpy(np.float64), df["taxes"].to_numpy(np.float64))
+        np.maximum(saved, 0, out=saved)
+        np.round(saved, 2, out=saved)
+        df["Estimated $ Saved"] = saved
         
-        # Flatten flights_json into readable columns
+        # Format the leg columns for display
         df = _leg_columns(df)
         
         # --- Robust "within my miles" handling (works across reruns) ---
-        if not df.empty and "miles" in df.columns:
-            df["miles"] = pd.to_numeric(df["miles"], errors="coerce")
-
         only_within = False
         within_mask = pd.Series(False, index=df.index)
 
         if miles_balance and miles_balance > 0 and not df.empty:
-            within_mask = (df["miles"] <= int(miles_balance))
-            num_within = int(within_mask.sum())
+            within_arr = df["miles"].to_numpy() <= int(miles_balance)
+            within_mask = pd.Series(within_arr, index=df.index)
+            num_within = int(within_arr.sum())
 
             if num_within > 0:
                 only_within = st.toggle(
@@ -311,31 +389,34 @@ if not errors:
             df["Within Your Miles?"] = within_mask
 
         # Build view_df (never let the table disappear)
+        # view_df is never written to in place (the sort below returns a new frame), so no copies here
         if only_within and within_mask.any():
-            view_df = df.loc[within_mask].copy()
+            view_df = df.loc[within_mask]
         elif only_within and not within_mask.any():
             st.info(f"No routes within {int(miles_balance):,} miles. Showing all results instead.")
-            view_df = df.copy()
+            view_df = df
         else:
-            view_df = df.copy()
+            view_df = df
         
-        # Global sort based on UI objective
-        if "Value per Mile (¢)" in view_df.columns and "price" in view_df.columns:
-            if ui_objective == "Minimum Price":
-                if "taxes" in view_df.columns:
-                    view_df = view_df.sort_values(
-                        ["price", "taxes", "Value per Mile (¢)"],
-                        ascending=[True, True, False],
-                        kind="mergesort"
-                    )
+        # the sorted view depends only on the search and these widgets; it is reused until one of them changes
+        view_key = (results_key, int(miles_balance), only_within, ui_objective)
+        cached_view = st.session_state.get("view_cache")
+        if cached_view is not None and cached_view[0] == view_key:
+            view_df = cached_view[1]
+        else:
+            # Global sort based on UI objective: one stable np.lexsort over the float64 columns (last key is primary)
+            if "Value per Mile (¢)" in view_df.columns and "price" in view_df.columns:
+                neg_vpm = -view_df["Value per Mile (¢)"].to_numpy(np.float64)
+                price_arr = view_df["price"].to_numpy(np.float64)
+                if ui_objective == "Minimum Price":
+                    if "taxes" in view_df.columns:
+                        order = np.lexsort((neg_vpm, view_df["taxes"].to_numpy(np.float64), price_arr))
+                    else:
+                        order = np.lexsort((neg_vpm, price_arr))
                 else:
-                    view_df = view_df.sort_values(["price", "Value per Mile (¢)"], ascending=[True, False], kind="mergesort")
-            else:
-                view_df = view_df.sort_values(
-                    ["Value per Mile (¢)", "price"],
-                    ascending=[False, True],
-                    kind="mergesort"
-                )
+                    order = np.lexsort((price_arr, neg_vpm))
+                view_df = view_df.iloc[order]
+            st.session_state["view_cache"] = (view_key, view_df)
         
         # Preferred columns order
         preferred_cols = [
@@ -348,65 +429,28 @@ if not errors:
         ]
         
         # ---- Map (optional via airports.csv) ----
-        import os, re, pandas as pd, pydeck as pdk
-
-        st.markdown("### 🗺️ Map")
-
-        csv_path = "airports.csv"
-        if not os.path.exists(csv_path):
-            st.caption("Add **airports.csv** (columns: `iata,lat,lon`) to enable the map.")
-        else:
-            airports_df = pd.read_csv(csv_path)
-            airports_df["iata"] = airports_df["iata"].astype(str).str.upper()
-
-            codes = set()
-
-            # from columns
-            if "origin" in view_df.columns:
-                codes |= set(view_df["origin"].dropna().astype(str).str.upper().tolist())
-            if "destination" in view_df.columns:
-                codes |= set(view_df["destination"].dropna().astype(str).str.upper().tolist())
-
-            # try to parse tokens like LAX, DEN, JFK inside the route column if it exists
-            if "route" in view_df.columns:
-                for r in view_df["route"].astype(str).fillna(""):
-                    for tok in re.findall(r"\b[A-Z]{3}\b", r):
-                        codes.add(tok)
-
-            pins = airports_df[airports_df["iata"].isin(sorted(codes))].copy()
-
-            if pins.empty:
-                st.caption("No matching airports from current results found in **airports.csv**.")
+        # off by default and only built while its toggle is on, like the two charts below. a collapsed st.expander
+        # would still run its body on every rerun; a toggle that is off skips the pins and the deck entirely
+        if st.toggle("🗺️ Show map", value=False, key="show_map"):
+            csv_path = "airports.csv"
+            if not os.path.exists(csv_path):
+                st.caption("Add **airports.csv** (columns: `iata,lat,lon`) to enable the map.")
             else:
-                # pydeck wants columns named lon/lat
-                pins = pins.rename(columns={"lon": "longitude", "lat": "latitude"})
-                midpoint = {
-                    "latitude": float(pins["latitude"].mean()),
-                    "longitude": float(pins["longitude"].mean()),
-                }
-
-                # set a reasonable zoom (wider if points spread out)
-                if len(pins) == 1:
-                    zoom = 8
-                else:
-                    zoom = 3
-
-                layer = pdk.Layer(
-                    "ScatterplotLayer",
-                    data=pins,
-                    get_position="[longitude, latitude]",
-                    get_color=[255, 69, 0, 255],  # Bright orange-red color
-                    get_radius=100000,  # Larger radius for better visibility
-                    pickable=True,
-                )
+                airports_df = _load_airports(csv_path, os.path.getmtime(csv_path))
 
-                tooltip = {"text": "{iata}"}
+                # from origin/destination plus any codes inside the route column, in one pass over each column
+                parts = [view_df[c] for c in ("origin", "destination") if c in view_df.columns]
+                if "route" in view_df.columns:
+                    parts.append(view_df["route"].astype(str).str.findall(_IATA_RE).explode())
+                codes = set(pd.concat(parts).dropna().astype(str).str.upper().unique().tolist()) if parts else set()
 
-                view_state = pdk.ViewState(
-                    latitude=midpoint["latitude"], longitude=midpoint["longitude"], zoom=zoom
-                )
+                pins = airports_df.loc[airports_df.index.intersection(list(codes))].reset_index()
 
-                st.pydeck_chart(pdk.Deck(layers=[layer], initial_view_state=view_state, tooltip=tooltip))
+                if pins.empty:
+                    st.caption("No matching airports from current results found in **airports.csv**.")
+                else:
+                    # columns come straight from airports.csv (iata, lat, lon); records are hashable for the cache key
+                    st.pydeck_chart(_build_deck(tuple(pins[["iata", "lat", "lon"]].itertuples(index=False, name=None))))
 
         
         # Layout: two columns
@@ -421,7 +465,8 @@ if not errors:
                 # Display sortable table with preferred column order
                 cols_to_show = [c for c in preferred_cols if c in view_df.columns]
                 st.dataframe(
-                    view_df[cols_to_show] if cols_to_show else view_df,
+                    view_df,
+                    column_order=cols_to_show or None,
                     use_container_width=True,
                     hide_index=True
                 )
@@ -429,7 +474,7 @@ if not errors:
                 # Download button
                 st.download_button(
                     label="📥 Download CSV",
-                    data=view_df.to_csv(index=False).encode("utf-8"),
+                    data=_df_to_csv_bytes(view_key, view_df),
                     file_name=f"recommendations_{origin}_{destination}_{start_date}_{end_date}.csv",
                     mime="text/csv"
                 )
@@ -439,15 +484,15 @@ if not errors:
             
             if not view_df.empty:
                 # Summary metrics
+                n_rows, best_vpm = _summary(view_key, view_df)
                 st.markdown(f"""
                 <div class="metric-card">
-                    <div class="metric-value">{len(view_df)}</div>
+                    <div class="metric-value">{n_rows}</div>
                     <div class="metric-label">Total Routes</div>
                 </div>
                 """, unsafe_allow_html=True)
                 
-                if "Value per Mile (¢)" in view_df.columns:
-                    best_vpm = view_df["Value per Mile (¢)"].max()
+                if best_vpm is not None:
                     st.markdown(f"""
                     <div class="metric-card">
                         <div class="metric-value">{best_vpm:.2f}¢</div>
@@ -457,15 +502,24 @@ if not errors:
                 
                 # Charts - Top 10 with unique labels
                 if not view_df.empty and "Value per Mile (¢)" in view_df.columns:
-                    st.write("**Top 10 by Value per Mile**")
-                    top = view_df.nlargest(10, "Value per Mile (¢)").copy()
-                    safe_type = top.get("type").astype(str) if "type" in top.columns else ""
-                    top["Label"] = top["airline"].astype(str) + " • " + top["date"].astype(str) + " • " + safe_type
-                    top = top.set_index("Label")
-                    st.bar_chart(top[["Value per Mile (¢)"]])
+                    if st.toggle("Show Top 10 by Value per Mile", value=False, key="show_top10"):
+                        # O(n) selection of the 10th-best value, then a stable sort of just the rows at or above it
+                        # (ties resolve by position, same as nlargest(keep="first"))
+                        vpm = view_df["Value per Mile (¢)"].to_numpy(np.float64)
+                        k = min(10, len(vpm))
+                        kth = np.partition(vpm, len(vpm) - k)[len(vpm) - k]
+                        cand = np.flatnonzero(vpm >= kth)
+                        top = view_df.iloc[cand[np.argsort(-vpm[cand], kind="stable")][:k]].copy()
+                        safe_type = top["type"].astype(str).to_numpy() if "type" in top.columns else [""] * len(top)
+                        top["Label"] = [
+                            f"{a} • {d} • {t}"
+                            for a, d, t in zip(top["airline"].astype(str).to_numpy(), top["date"].astype(str).to_numpy(), safe_type)
+                        ]
+                        top = top.set_index("Label")
+                        st.bar_chart(top[["Value per Mile (¢)"]])
                 
                 if "price" in view_df.columns and "miles" in view_df.columns and len(view_df) > 1:
-                    st.write("**Price vs Miles**")
-                    st.scatter_chart(view_df, x="miles", y="price")
+                    if st.toggle("Show Price vs Miles", value=False, key="show_scatter"):
+                        st.scatter_chart(view_df, x="miles", y="price")
 
 
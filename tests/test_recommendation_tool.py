@@ -0,0 +1,336 @@
+# regression tests for recommend_routes, checked against known outputs from the shipped database.
+# the shipped .db is only ever opened read-only; anything that writes works on a copy in tmp_path
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import recommendation_tool as rt
+
+DB = Path(__file__).resolve().parents[1] / "travel_data_with_miles.db"
+
+# LAX -> JFK over the whole of August is the busiest route with both directs and synthetics
+AUGUST = ("LAX", "JFK", "2025-08-01", "2025-08-31")
+
+
+def _routes(*args, **kwargs):
+    kwargs.setdefault("db_path", str(DB))
+    kwargs.setdefault("max_results", None)
+    return rt.recommend_routes(*(args or AUGUST), **kwargs)
+
+
+def _rows(df):
+    return sorted(df[["date", "type", "airline", "price", "miles"]].astype(str).itertuples(index=False))
+
+
+@pytest.fixture
+def db_copy(tmp_path):
+    path = tmp_path / "flights.db"
+    shutil.copyfile(DB, path)
+    return path
+
+
+@pytest.fixture
+def db_without_indexes(db_copy):
+    with sqlite3.connect(db_copy) as conn:
+        conn.executescript("".join(f"DROP INDEX {name};" for name in rt._INDEX_NAMES))
+    conn.close()
+    return db_copy
+
+
+@pytest.fixture
+def shipped_db(monkeypatch):
+    # the per-date helpers always read DB_PATH, which is relative to the repo root
+    monkeypatch.setattr(rt, "DB_PATH", str(DB))
+
+
+# known outputs
+
+def test_known_counts():
+    df = _routes()
+    assert len(df) == 347
+    assert df["type"].value_counts().to_dict() == {"Direct": 312, "Synthetic": 35}
+
+
+def test_known_top_rows_by_vpm():
+    df = _routes(max_results=3)
+    # synthetic prices are float sums (146.79 is 146.79000000000002), so prices are compared to the cent
+    df["price"] = df["price"].round(2)
+    assert df[["date", "type", "airline", "price", "miles", "value_per_mile_cents", "layover_minutes"]].values.tolist() == [
+        ["2025-08-24", "Direct", "American Airlines", 628.48, 24234, 2.55, pd.NA],
+        ["2025-08-28", "Synthetic", "Nimbus Air+StarFly", 146.79, 5761, 2.16, 403],
+        ["2025-08-22", "Synthetic", "SkyLynx+JetBliss", 162.76, 6545, 2.14, 190],
+    ]
+
+
+def test_known_top_rows_by_fees():
+    df = _routes(objective="min_fees", max_results=3)
+    assert df[["date", "airline", "price", "taxes"]].values.tolist() == [
+        ["2025-08-19", "Frontier Airlines", 89.98, 11.2],
+        ["2025-08-13", "Frontier Airlines", 89.99, 11.2],
+        ["2025-08-11", "Frontier Airlines", 91.98, 11.2],
+    ]
+
+
+def test_no_synthetics():
+    df = _routes(include_synthetic=False)
+    assert len(df) == 312
+    assert (df["type"] == "Direct").all()
+
+
+# synthetic totals come from the self-join
+
+def test_synthetic_totals_add_up():
+    df = _routes()
+    synthetic = df[df["type"] == "Synthetic"]
+    assert (synthetic["leg1_price"] + synthetic["leg2_price"]).round(2).equals(synthetic["price"].round(2))
+    assert (synthetic["leg1_miles"] + synthetic["leg2_miles"]).astype("int32").equals(synthetic["miles"])
+
+
+# one range query per leg type
+
+def test_range_matches_per_day_lookups(shipped_db):
+    df = _routes("LAX", "JFK", "2025-08-01", "2025-08-07")
+    for day in (f"2025-08-0{d}" for d in range(1, 8)):
+        on_day = df[df["date"] == day]
+        directs = rt.get_direct_flights("LAX", "JFK", day)
+        synthetics = list(rt.get_synthetic_routes("LAX", "JFK", day, None))
+        assert (on_day["type"] == "Direct").sum() == len(directs)
+        assert (on_day["type"] == "Synthetic").sum() == len(synthetics)
+
+
+def test_reversed_date_range():
+    assert _routes("LAX", "JFK", "2025-08-31", "2025-08-01").equals(_routes())
+
+
+# indexes
+
+def test_shipped_db_has_the_indexes(caplog):
+    assert rt.check_indexes(str(DB))
+    assert not caplog.text
+
+
+def test_check_indexes_logs_missing_ones(db_without_indexes, caplog):
+    assert rt.check_indexes(str(db_without_indexes)) is False
+    assert "idx_flights_od_date_dep" in caplog.text
+
+
+def test_ensure_indexes(db_without_indexes):
+    assert rt.ensure_indexes(db_without_indexes)
+    with sqlite3.connect(db_without_indexes) as conn:
+        names = {row[0] for row in conn.execute(rt.SQL_INDEX_NAMES)}
+    conn.close()
+    assert rt._INDEX_NAMES <= names
+    # running it again is a no-op
+    assert rt.ensure_indexes(db_without_indexes)
+
+
+def test_ensure_indexes_on_missing_file(tmp_path, caplog):
+    missing = tmp_path / "missing.db"
+    assert rt.ensure_indexes(missing) is False
+    assert not missing.exists()
+    assert "can't open" in caplog.text
+
+
+# allowlist matching
+
+def test_allowlist_is_exact_and_case_insensitive():
+    delta = _routes(airline_allowlist=["delta"])
+    assert len(delta) == 86
+    assert (delta["airline"] == "Delta").all()
+    assert _routes(airline_allowlist=[" DELTA "]).equals(delta)
+    # no substring matching: "Star" is not "StarFly"
+    assert _routes(airline_allowlist=["Star"]).empty
+
+
+def test_allowlist_matches_either_leg():
+    df = _routes(airline_allowlist=["StarFly"])
+    assert len(df) == 17
+    assert (df["type"] == "Synthetic").all()
+    assert ((df["leg1_airline"] == "StarFly") | (df["leg2_airline"] == "StarFly")).all()
+
+
+@pytest.mark.parametrize("allowlist", [None, [], ["", "  "]])
+def test_empty_allowlist_keeps_everything(allowlist):
+    assert _routes(airline_allowlist=allowlist).equals(_routes())
+
+
+def test_null_airline(db_copy):
+    with sqlite3.connect(db_copy) as conn:
+        conn.execute("""
+            UPDATE flights SET airline = NULL
+            WHERE rowid = (SELECT rowid FROM flights WHERE route_origin = 'LAX' AND route_destination = 'JFK'
+                           AND airline = 'Delta' ORDER BY date, departure_time LIMIT 1)
+        """)
+    conn.close()
+    df = _routes(db_path=str(db_copy))
+    assert len(df) == 347
+    assert df["airline"].isna().sum() == 1
+    assert len(_routes(airline_allowlist=["Delta"], db_path=str(db_copy))) == 85
+
+
+# top-k cutoff and sort keys
+
+def test_vpm_sort_order():
+    df = _routes()
+    keys = list(zip(-df["value_per_mile_cents"], df["price"]))
+    assert keys == sorted(keys)
+
+
+def test_min_fees_sort_order():
+    df = _routes(objective="min_fees")
+    keys = list(zip(df["taxes"], df["price"], -df["value_per_mile_cents"]))
+    assert keys == sorted(keys)
+
+
+@pytest.mark.parametrize("max_results", [None, 0])
+def test_no_cutoff(max_results):
+    assert len(_routes(max_results=max_results)) == 347
+
+
+# fees
+
+def test_international_fees():
+    df = _routes("JFK", "LHR", "2025-08-01", "2025-08-03")
+    assert len(df) == 20
+    assert (df["taxes"] == 50.0).all()
+    assert df.loc[0, ["date", "airline", "price", "value_per_mile_cents"]].tolist() == [
+        "2025-08-02", "British Airways", 284.0, 0.68,
+    ]
+
+
+# layover sql
+
+@pytest.mark.parametrize("minutes, synthetics", [(0, 36), (45, 35), (60, 34), (89, 30), (90, 26), (120, 24)])
+def test_min_layover(minutes, synthetics):
+    df = _routes(min_layover_minutes=minutes)
+    synthetic = df[df["type"] == "Synthetic"]
+    assert len(synthetic) == synthetics
+    # the second flight has to leave strictly after the minimum layover
+    assert (synthetic["layover_minutes"] > minutes).all()
+
+
+def test_layover_minutes():
+    df = _routes()
+    synthetic = df[df["type"] == "Synthetic"]
+    gap = pd.to_datetime(synthetic["leg2_departure_time"]) - pd.to_datetime(synthetic["leg1_arrival_time"])
+    assert (synthetic["layover_minutes"] == (gap.dt.total_seconds() // 60).astype(int)).all()
+    assert df.loc[df["type"] == "Direct", "layover_minutes"].isna().all()
+
+
+# read-only connections
+
+def test_missing_database(tmp_path):
+    with pytest.raises(sqlite3.OperationalError):
+        _routes(db_path=str(tmp_path / "missing.db"))
+    assert not (tmp_path / "missing.db").exists()
+
+
+def test_read_only_connection_cannot_write():
+    with pytest.raises(sqlite3.OperationalError):
+        rt._conn(str(DB)).execute("DELETE FROM flights")
+
+
+# ties
+
+def test_ties_ordered_by_date_then_type():
+    df = _routes()
+    keys = list(zip(-df["value_per_mile_cents"], df["price"], df["date"], df["type"] != "Direct"))
+    assert keys == sorted(keys)
+
+
+@pytest.mark.parametrize("objective", ["vpm", "min_fees"])
+def test_cutoff_keeps_the_same_rows(objective):
+    full = _routes(objective=objective)
+    for n in (1, 5, 25, 100):
+        assert _routes(objective=objective, max_results=n).equals(full.head(n))
+
+
+@pytest.mark.parametrize("objective", ["vpm", "min_fees"])
+def test_order_does_not_depend_on_indexes(db_without_indexes, objective):
+    # without the indexes sqlite returns rows in another order; the result must not change
+    assert _routes(objective=objective, db_path=str(db_without_indexes)).equals(_routes(objective=objective))
+
+
+# single-day best route
+
+def test_best_route_for_a_day(shipped_db):
+    hubs = rt.get_possible_hub_airports("LAX", "JFK", "2025-08-28")
+    best = rt.recommend_best_route("LAX", "JFK", "2025-08-28", hubs)
+    top = _routes("LAX", "JFK", "2025-08-28", "2025-08-28", max_results=1).iloc[0]
+    assert best["type"] == top["type"]
+    assert best["value_per_mile"] == top["value_per_mile_cents"]
+    assert best["price"] == pytest.approx(top["price"])
+
+
+def test_best_route_on_an_empty_day(shipped_db):
+    assert rt.recommend_best_route("LAX", "XXX", "2025-08-28", []) == "No flights available for that day."
+
+
+# filters pushed into sql
+
+def test_max_price():
+    df = _routes(max_price=200)
+    assert len(df) == 137
+    assert (df["price"] <= 200).all()
+    full = _routes()
+    assert _rows(df) == _rows(full[full["price"] <= 200])
+
+
+def test_min_vpm():
+    df = _routes(min_vpm_cents=1.5)
+    assert len(df) == 28
+    assert (df["value_per_mile_cents"] >= 1.5).all()
+    full = _routes()
+    assert _rows(df) == _rows(full[full["value_per_mile_cents"] >= 1.5])
+
+
+# connection slots
+
+def test_connections_are_cached_per_slot():
+    assert rt._conn(str(DB)) is rt._conn(str(DB))
+    assert rt._conn(str(DB), slot=1) is not rt._conn(str(DB))
+    assert rt._conn(str(DB), read_only=1) is rt._conn(str(DB), read_only=True)
+
+
+# dtypes
+
+def test_money_stays_float64():
+    df = _routes()
+    for col in ("price", "taxes", "value_per_mile_cents", "leg1_price", "leg2_price"):
+        assert df[col].dtype == "float64"
+    assert df["miles"].dtype == "int32"
+    assert df["airline"].dtype == "category"
+
+
+# flat leg columns
+
+def test_direct_rows_have_no_second_leg():
+    df = _routes()
+    direct = df[df["type"] == "Direct"]
+    assert direct["leg1_price"].equals(direct["price"])
+    assert direct[[c for c in df.columns if c.startswith("leg2_")]].isna().all().all()
+
+
+def test_leg_dtypes_do_not_depend_on_the_rows():
+    full = _routes()
+    directs_only = _routes(max_results=1)
+    assert (directs_only["type"] == "Direct").all()
+    assert directs_only.dtypes.equals(full.dtypes)
+    assert full["leg2_airline"].dtype == "object"
+    assert full["leg2_miles"].dtype == "Int32"
+
+
+def test_empty_result_keeps_the_schema():
+    full = _routes()
+    empty = _routes(max_price=1)
+    assert empty.empty
+    assert list(empty.columns) == list(full.columns)
+    assert empty["leg1_price"].dtype == "float64"
+    assert empty["leg2_miles"].dtype == "Int32"
+
+
+def test_unknown_route():
+    assert _routes("LAX", "XXX", "2025-08-01", "2025-08-31").empty
@@ -0,0 +1,153 @@
+# app-level checks run through streamlit's AppTest against the shipped database.
+# the app reads style.css, airports.csv and the .db by relative path, so every test runs from the repo root
+import hashlib
+import shutil
+import sqlite3
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import recommendation_tool as rt
+
+ROOT = Path(__file__).resolve().parents[1]
+DB = ROOT / "travel_data_with_miles.db"
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    return AppTest.from_file(str(ROOT / "streamlit_app.py"), default_timeout=60)
+
+
+@pytest.fixture
+def searched(app):
+    # the default search: LAX -> JFK on 2025-08-15, directs and synthetics
+    app.run()
+    app.button[0].click().run()
+    assert not app.exception
+    return app
+
+
+@pytest.fixture
+def app_on_copy(tmp_path, monkeypatch):
+    # the app run from tmp_path against a copy of the .db. connections and the search cache are keyed on the
+    # relative path, so both are cleared before and after
+    shutil.copyfile(DB, tmp_path / DB.name)
+    shutil.copyfile(ROOT / "style.css", tmp_path / "style.css")
+    monkeypatch.chdir(tmp_path)
+    st.cache_data.clear()
+    rt._open_conn.cache_clear()
+    yield AppTest.from_file(str(ROOT / "streamlit_app.py"), default_timeout=60)
+    st.cache_data.clear()
+    rt._open_conn.cache_clear()
+
+
+def _search(app, day):
+    app.run()
+    app.date_input[0].set_value(day)
+    app.date_input[1].set_value(day)
+    app.button[0].click().run()
+    assert not app.exception
+    return app.dataframe[0].value
+
+
+def _chart_data(app, i=0):
+    chart = app.get("vega_lite_chart")[i].proto
+    return pa.ipc.open_stream(chart.datasets[0].data.data).read_pandas()
+
+
+def _sha1(path):
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+# startup
+
+def test_startup_leaves_the_db_alone(app):
+    before = _sha1(DB)
+    app.run()
+    app.button[0].click().run()
+    assert not app.exception
+    assert _sha1(DB) == before
+
+
+# leg columns
+
+def test_leg_columns(searched):
+    table = searched.dataframe[0].value
+    assert not [c for c in table.columns if c.startswith(("leg1_", "leg2_"))]
+    synthetic = table[table["type"] == "Synthetic"].iloc[0]
+    assert synthetic[["Leg 1 Flight", "Leg 1 Departs", "Leg 2 Flight", "Leg 2 Arrives", "Layover (min)"]].tolist() == [
+        "FakeFlyer FF303", "2025-08-15 07:00", "BudgetJet BJ404", "2025-08-15 16:00", "90",
+    ]
+    direct = table[table["type"] == "Direct"]
+    assert (direct["Leg 1 Flight"] != "").all()
+    assert (direct[["Leg 2 Flight", "Leg 2 Departs", "Leg 2 Arrives", "Layover (min)"]] == "").all().all()
+
+
+def test_null_airlines_keep_their_leg(app_on_copy, tmp_path):
+    # Aug 31 has directs only; with every airline on it NULL, leg 1 still shows the flight and its times
+    with sqlite3.connect(tmp_path / DB.name) as conn:
+        conn.execute("UPDATE flights SET airline = NULL WHERE route_origin = 'LAX' AND route_destination = 'JFK' AND date = '2025-08-31'")
+    conn.close()
+    table = _search(app_on_copy, date(2025, 8, 31))
+    assert (table["type"] == "Direct").all()
+    assert table["Leg 1 Flight"].str.fullmatch(r"\w+").all()
+    assert table["Leg 1 Departs"].str.startswith("2025-08-31 ").all()
+    assert (table[["Leg 2 Flight", "Leg 2 Departs", "Leg 2 Arrives"]] == "").all().all()
+
+
+# top 10 chart
+
+def test_top10_matches_nlargest(searched):
+    searched.toggle(key="show_top10").set_value(True).run()
+    table = searched.dataframe[0].value
+    expected = table.nlargest(10, "Value per Mile (¢)", keep="first")
+    chart = _chart_data(searched)
+    assert chart["Value per Mile (¢)"].tolist() == expected["Value per Mile (¢)"].tolist()
+    assert chart["Label"].tolist() == [
+        f"{a} • {d} • {t}" for a, d, t in zip(expected["airline"], expected["date"], expected["type"])
+    ]
+
+
+# sorted view cache
+
+def test_view_is_reused_until_a_view_setting_changes(searched):
+    key, view = searched.session_state["view_cache"]
+    assert key[0] == searched.session_state["results"][0]
+    searched.run()
+    assert searched.session_state["view_cache"][1] is view
+
+    objective = next(box for box in searched.selectbox if box.label == "Objective")
+    objective.set_value("Minimum Price").run()
+    key, view = searched.session_state["view_cache"]
+    assert key[-1] == "Minimum Price"
+    assert view["price"].is_monotonic_increasing
+
+
+def test_results_from_an_older_session_shape_are_ignored(app):
+    # a session that survived a reload with only the old results_df entry shows the empty state instead of failing
+    app.session_state["results_df"] = pd.DataFrame({"price": [1.0]})
+    app.run()
+    assert not app.exception
+    assert not app.dataframe
+
+
+# map and chart toggles
+
+def test_map_and_charts_are_built_only_while_toggled_on(searched):
+    assert not searched.get("deck_gl_json_chart")
+    assert not searched.get("vega_lite_chart")
+
+    for key in ("show_map", "show_top10", "show_scatter"):
+        searched.toggle(key=key).set_value(True)
+    searched.run()
+    assert not searched.exception
+    assert len(searched.get("deck_gl_json_chart")) == 1
+    assert len(searched.get("vega_lite_chart")) == 2
+    # the scatter gets every row of the table
+    assert len(_chart_data(searched, 1)) == len(searched.dataframe[0].value)